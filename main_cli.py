@@ -1,316 +1,848 @@
 import argparse
-from playwright.sync_api import sync_playwright
+import asyncio
+import csv
+from playwright.async_api import async_playwright, Error as PlaywrightError
 import pandas as pd
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlencode, parse_qsl, urlunparse
+import importlib.util
 import os
 import platform
+import re
 import time
 from tqdm import tqdm
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Nombre de pages de pagination chargées en parallèle dans le même contexte navigateur
+MAX_PARALLEL_PAGES = 4
+
+# Réponse XHR JSON reconnue comme l'API produits interne (URL contenant tous ces fragments)
+API_URL_HINTS = ('/api/', 'product')
+# En-têtes du navigateur à ne pas rejouer tels quels avec httpx
+API_SKIPPED_HEADERS = {'host', 'content-length', 'cookie', 'accept-encoding'}
+# Part minimale des produits de la page 1 (DOM) que la page 1 de l'API doit retrouver pour être retenue:
+# écarte les endpoints de recommandations/sponsorisés qui ignorent ?page=
+API_MIN_MATCH_RATIO = 0.8
+# Clés candidates du libellé promo dans le JSON de l'API
+API_PROMO_KEYS = ('promotionLabel', 'promoLabel', 'discountLabel')
+
+# Erreurs transitoires pour lesquelles une navigation/un clic est retenté
+TRANSIENT_ERRORS = ('timeout', 'err_network_changed', 'err_connection', 'err_timed_out', 'crashed')
+
+# État navigateur (cookies de consentement OneTrust) réutilisé d'un run à l'autre
+STORAGE_STATE_PATH = os.path.expanduser('~/.cache/scrapc/state.json')
+CONSENT_COOKIE = 'OptanonAlertBoxClosed'
+
+PRODUCT_ITEM_SELECTOR = 'li.product-list-grid__item'
+# Conteneur de la pagination: seuls ses liens ?page=N servent à connaître la dernière page
+PAGINATION_SELECTOR = 'nav[aria-label*="agination"], .pagination, [class*="pagination"]'
+
+# Plus grand ?page=N parmi les liens du conteneur de pagination, null sans conteneur
+LAST_PAGE_JS = """
+(selector) => {
+    const pagers = document.querySelectorAll(selector);
+    if (!pagers.length) return null;
+    let last = null;
+    for (const pager of pagers) {
+        for (const a of pager.querySelectorAll('a[href*="page="]')) {
+            const n = parseInt(new URL(a.href).searchParams.get('page'), 10);
+            if (n > 0 && (last === null || n > last)) last = n;
+        }
+    }
+    return last;
+}
+"""
+
+# Délai max d'apparition de nouveaux items après un défilement en bas de page
+INFINITE_SCROLL_WAIT_MS = 2000
+# Délai laissé au bouton "plus de produits"/"page suivante" pour s'hydrater avant de conclure au défilement infini
+LOADING_CONTROLS_WAIT_MS = 3000
+
+# Colonnes des fichiers de sortie
+FIELDNAMES = ['name', 'price', 'unit_price', 'ean', 'nutriscore', 'promo', 'url']
+
+# Formats écrits au fil de l'extraction: format -> (séparateur, encodage).
+# Excel et JSON restent bufferisés en mémoire puis écrits en fin de run.
+STREAMED_FORMATS = {
+    'csv': (';', 'utf-8-sig'),
+    'txt': ('\t', 'utf-8')
+}
+
+# Lettre Nutri-Score dans l'URL du badge ("…/nutriscore-b.svg" -> "b"); "u"/"unknown" = non noté -> "U"
+NUTRISCORE_RE = re.compile(r'nutriscore[-_]?([a-eu])(?:nknown)?(?:[._-]|$)', re.IGNORECASE)
+
+# Prix affiché en morceaux (entier / décimales / devise) -> "1,99 €"
+PRICE_RE = re.compile(r'(\d+)\s*[.,]\s*(\d+)\s*(€|EUR)?', re.IGNORECASE)
+
+# Partie numérique d'un prix formaté ("1,23 €" -> "1,23")
+PRICE_NUM_RE = re.compile(r'(\d+(?:[.,]\d+)?)')
+
+# xlsxwriter écrit nettement plus vite qu'openpyxl lorsqu'il est installé
+EXCEL_ENGINE = 'xlsxwriter' if importlib.util.find_spec('xlsxwriter') else None
+
+# Ressources inutiles à l'extraction (seuls les textes et l'attribut src sont lus)
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font'}
+BLOCKED_DOMAINS = ('googletagmanager', 'google-analytics', 'doubleclick', 'criteo', 'facebook.net')
+
+LOAD_MORE_SELECTORS = [
+    'button[aria-label="Afficher les produits suivants"]',
+    'button:has-text("Afficher les produits suivants")',
+    'button:has-text("Voir plus")',
+    'button:has-text("Afficher plus")'
+]
+
+NEXT_SELECTORS = [
+    'a[rel="next"]',
+    'a[aria-label="Page suivante"]',
+    'button[aria-label="Page suivante"]',
+    'a:has-text("Suivant")',
+    'button:has-text("Suivant")'
+]
+
+PROMO_SELECTORS = [
+    '.sticker-promo__text',
+    '.product-card-badge__labels',
+    '.promo-badge',
+    '[class*="promotion"]',
+    '[class*="discount"]'
+]
+
+# Lecture groupée de tous les champs produits en un seul page.evaluate
+PRODUCTS_JS = """
+({itemSelector, promoSelector, startIndex}) => Array.from(document.querySelectorAll(itemSelector)).slice(startIndex).map(li => {
+    const text = (sel) => li.querySelector(sel)?.innerText ?? null;
+    return {
+        name: text('.product-list-card-plp-grid__title'),
+        price_raw: li.querySelector('.product-price__content')?.parentElement?.innerText ?? null,
+        price_main: text('.product-price__amount--main'),
+        unit_price: text('.product-list-card-plp-grid__per-unit-label'),
+        article_id: li.querySelector('article')?.id ?? null,
+        href: li.querySelector('a[href^="/p/"]')?.getAttribute('href') ?? null,
+        nutriscore_src: li.querySelector('.nutriscore-badge img')?.getAttribute('src') ?? null,
+        promos: Array.from(li.querySelectorAll(promoSelector), el => el.innerText),
+        old_price: text('.product-price__amount--old')
+    };
+})
+"""
 
 class CarrefourScraperCLI:
     def __init__(self):
         self.config = {
-            'timeout': 30000,
+            'timeout': 15000,
             'headless': True,
             'user_agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            'max_load_attempts': 20
+            'max_load_attempts': 20,
+            'max_parallel_pages': MAX_PARALLEL_PAGES,
+            'retry_attempts': 3,
+            'retry_backoff': 1.0,
+            'storage_state_path': STORAGE_STATE_PATH
         }
         self.products = []
+        self._seen_urls = set()
+        self._stream = None
+        self._writer = None
+        self._streamed = False
+        self._stream_path = None
+        self._stream_tmp = None
+        self._stats = {'first_name': None, 'price_total': 0.0, 'price_count': 0}
+        self._lock = None
+        self._pool = None
+        self._api_candidates = []
+        self._api_request = None
+        # Sélecteurs promo combinés (union CSS): une seule requête DOM au lieu d'une par variante
+        self._promo_sel = ', '.join(PROMO_SELECTORS)
 
     def run(self, url, output_format='csv', output_file=None):
-        """Main execution method"""
+        """Main execution method (sync wrapper around the async scraper)"""
+        asyncio.run(self._run_async(url, output_format, output_file))
+
+    async def _run_async(self, url, output_format='csv', output_file=None):
+        """Async scraping pipeline"""
         print(f"\n🚀 Starting Carrefour Scraper for URL: {url}")
         
         start_time = time.time()
+        self._lock = asyncio.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=2)
+        if not output_file:
+            output_file = f"carrefour_products_{int(start_time)}.{output_format}"
+        self.open_stream(output_format, output_file)
         
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=self.config['headless'])
-            context = browser.new_context(user_agent=self.config['user_agent'])
-            page = context.new_page()
-            
-            print("\n🌐 Navigating to page...")
-            page.goto(url, wait_until="networkidle", timeout=self.config['timeout'])
-            
-            self.handle_cookies(page)
-            
-            print("\n🔍 Extracting products...")
-            self.extract_all_products(page)
-            
-            browser.close()
+        try:
+            async with async_playwright() as p:
+                browser = await p.chromium.launch(headless=self.config['headless'])
+                state_path = self.config['storage_state_path']
+                context = await browser.new_context(
+                    user_agent=self.config['user_agent'],
+                    storage_state=state_path if state_path and os.path.exists(state_path) else None
+                )
+                await context.route("**/*", self.block_resources)
+                page = await context.new_page()
+                # Écoute au niveau du contexte: reste active si navigate() remplace un onglet planté
+                context.on('response', self._sniff_api)
+                
+                print("\n🌐 Navigating to page...")
+                page = await self.navigate(page, url)
+                
+                if await self.handle_cookies(page) and state_path:
+                    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+                    await context.storage_state(path=state_path)
+                await self.wait_for_products(page)
+                
+                print("\n🔍 Extracting products...")
+                page_urls = await self.discover_page_urls(page, url)
+                context.remove_listener('response', self._sniff_api)
+                if page_urls:
+                    await self.extract_paginated_products(context, page, page_urls)
+                else:
+                    await self.extract_all_products(page)
+                
+                await browser.close()
+        except BaseException:
+            # Échec: le fichier cible d'un run précédent reste intact
+            self.close_stream(keep=False)
+            raise
+        finally:
+            self._pool.shutdown()
         
         duration = time.time() - start_time
-        print(f"\n✅ Completed! Found {len(self.products)} products in {duration:.2f} seconds")
+        print(f"\n✅ Completed! Found {len(self._seen_urls)} products in {duration:.2f} seconds")
         
-        if self.products:
+        if self._seen_urls:
             self.save_results(output_format, output_file)
         else:
+            self.close_stream(keep=False)
             print("⚠️ No products found - check the URL or try again")
 
-    def handle_cookies(self, page):
-        """Handle cookie consent banner"""
+    def open_stream(self, format_type, output_file):
+        """Open a temp file next to the output for formats that can be written row by row"""
+        if format_type not in STREAMED_FORMATS:
+            return
+        delimiter, encoding = STREAMED_FORMATS[format_type]
+        root, ext = os.path.splitext(output_file)
+        self._stream_path = output_file
+        self._stream_tmp = f"{root}.tmp{ext}"
+        self._stream = open(self._stream_tmp, 'w', newline='', encoding=encoding)
+        self._writer = csv.DictWriter(self._stream, fieldnames=FIELDNAMES, delimiter=delimiter, lineterminator=os.linesep)
+        self._writer.writeheader()
+        self._streamed = True
+
+    def write_rows(self, rows):
+        """Append freshly extracted rows to the open output file"""
+        self._writer.writerows(rows)
+        self._stream.flush()
+
+    def record_stats(self, rows):
+        """Accumulate the summary figures so no second pass over the products is needed"""
+        stats = self._stats
+        if stats['first_name'] is None and rows:
+            stats['first_name'] = rows[0]['name']
+        for row in rows:
+            m = PRICE_NUM_RE.search(row['price'] or '')
+            if m:
+                stats['price_total'] += float(m.group(1).replace(',', '.'))
+                stats['price_count'] += 1
+
+    def close_stream(self, keep):
+        """Publish the streamed file onto the output path (keep=True) or drop it"""
+        if self._stream is None:
+            return
+        self._stream.close()
+        self._stream = None
+        self._writer = None
+        if keep:
+            os.replace(self._stream_tmp, self._stream_path)
+        elif os.path.exists(self._stream_tmp):
+            os.remove(self._stream_tmp)
+
+    async def block_resources(self, route):
+        """Abort images, fonts, media and trackers; let everything else through"""
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or any(d in request.url for d in BLOCKED_DOMAINS):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def handle_cookies(self, page):
+        """Handle cookie consent banner, returning True when it was dismissed"""
+        if await page.evaluate("(name) => document.cookie.split('; ').some(c => c.startsWith(name + '='))", CONSENT_COOKIE):
+            print("✓ Cookie consent already stored")
+            return False
         try:
-            page.click('#onetrust-reject-all-handler', timeout=3000)
+            await page.click('#onetrust-reject-all-handler', timeout=3000)
             print("✓ Handled cookie consent")
-            page.wait_for_timeout(1000)
-        except:
+            # Rend la main dès que le bandeau disparaît au lieu d'une attente fixe
+            try:
+                await page.wait_for_selector('#onetrust-banner-sdk', state='hidden', timeout=2000)
+            except Exception:
+                pass
+            return True
+        except Exception:
             print("⚠️ Could not find cookie consent banner")
-            pass
+            return False
+
+    async def _retry(self, action):
+        """Run an async Playwright action, retrying transient failures with exponential backoff"""
+        attempts = self.config['retry_attempts']
+        for i in range(attempts):
+            try:
+                return await action()
+            except PlaywrightError as e:
+                message = str(e).lower()
+                if i == attempts - 1 or not any(t in message for t in TRANSIENT_ERRORS):
+                    raise
+                delay = self.config['retry_backoff'] * 2 ** i
+                print(f"\n⚠️ {str(e).splitlines()[0]} → nouvel essai dans {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+    async def navigate(self, page, url):
+        """page.goto with retries; returns the page to keep using (replaced if it crashed)"""
+        async def goto():
+            nonlocal page
+            try:
+                await page.goto(url, wait_until="domcontentloaded", timeout=self.config['timeout'])
+            except PlaywrightError as e:
+                if 'crashed' in str(e).lower():
+                    crashed = page
+                    page = await crashed.context.new_page()
+                    await crashed.close()
+                raise
+
+        await self._retry(goto)
+        return page
+
+    async def wait_for_products(self, page):
+        """Wait until the product grid is attached instead of waiting for network idle"""
+        try:
+            await page.wait_for_selector(PRODUCT_ITEM_SELECTOR, state='attached', timeout=self.config['timeout'])
+        except Exception:
+            print("⚠️ Product grid did not appear before timeout")
+
+    async def discover_page_urls(self, page, url):
+        """Return the URLs of pages 2..N when the pager exposes ?page=N links.
+
+        Only the pagination container is read: a ?page= link elsewhere (filters, footer,
+        other listings) must not invent pages. Without a pager, nothing is returned and
+        the loading-mode detection takes over.
+        """
+        try:
+            last_page = await page.evaluate(LAST_PAGE_JS, PAGINATION_SELECTOR)
+        except Exception:
+            return []
+        if not last_page:
+            return []
+
+        return [build_page_url(url, n) for n in range(2, last_page + 1)]
+
+    def _sniff_api(self, response):
+        """Collect the JSON XHRs of page 1 that look like a product API (validated later)"""
+        content_type = response.headers.get('content-type', '')
+        if all(h in response.url for h in API_URL_HINTS) and content_type.startswith('application/json'):
+            if any(url == response.url for url, _ in self._api_candidates):
+                return
+            headers = {k: v for k, v in response.request.headers.items()
+                       if not k.startswith(':') and k.lower() not in API_SKIPPED_HEADERS}
+            self._api_candidates.append((response.url, headers))
+
+    async def open_api_client(self, context, page1_rows):
+        """httpx client on the sniffed endpoint whose page 1 matches the DOM's page 1, or None"""
+        if httpx is None or not self._api_candidates:
+            return None
+        cookies = {c['name']: c['value'] for c in await context.cookies()}
+        client = httpx.AsyncClient(
+            cookies=cookies,
+            timeout=self.config['timeout'] / 1000,
+            http2=importlib.util.find_spec('h2') is not None
+        )
+        for api_url, headers in self._api_candidates:
+            client.headers.update(headers)
+            if self._api_matches(await self._fetch_api_rows(client, api_url, 1), page1_rows):
+                self._api_request = (api_url, headers)
+                return client
+            for name in headers:
+                client.headers.pop(name, None)
+        await client.aclose()
+        return None
+
+    async def _fetch_api_rows(self, client, api_url, page_num):
+        try:
+            response = await client.get(build_page_url(api_url, page_num))
+            response.raise_for_status()
+            payload = response.json()
+        except (httpx.HTTPError, ValueError):
+            return []
+        return self._api_rows(payload)
+
+    def _api_matches(self, api_rows, dom_rows):
+        """True when the API's page 1 is the listing's page 1 and yields identical rows"""
+        if not api_rows or not dom_rows:
+            return False
+        dom = {}
+        for row in dom_rows:
+            dom[_canonical_url(row['url'])] = row
+            if row['ean']:
+                dom[row['ean']] = row
+        hits = [(a, dom.get(_canonical_url(a['url'])) or dom.get(a['ean'])) for a in api_rows]
+        hits = [(a, d) for a, d in hits if d is not None]
+        if len(hits) < API_MIN_MATCH_RATIO * max(len(api_rows), len(dom_rows)):
+            return False
+        # Chaque colonne de sortie doit être identique à celle lue dans le DOM: sinon les pages
+        # servies par l'API changeraient noms, URLs, Nutri-Score... par rapport aux autres
+        if any(a[field] != d[field] for a, d in hits for field in FIELDNAMES):
+            return False
+        # Sans promo vérifiable sur la page 1, on reste sur le navigateur plutôt que
+        # de risquer de perdre les promos des pages suivantes
+        return any(d['promo'] for _, d in hits)
+
+    def _api_rows(self, payload):
+        """Best-effort mapping of the API JSON: any object carrying an EAN and a title is a product"""
+        rows = []
+        stack = [payload]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(reversed(node))
+            elif isinstance(node, dict):
+                attrs = node.get('attributes') if isinstance(node.get('attributes'), dict) else node
+                if attrs.get('ean') and (attrs.get('title') or attrs.get('name')):
+                    rows.append(self._api_row(attrs))
+                else:
+                    stack.extend(reversed(list(node.values())))
+        return [row for row in rows if row['url']]
+
+    def _api_row(self, attrs):
+        """Build a product row from one API product object"""
+        ean = str(attrs['ean'])
+        slug = attrs.get('url') or attrs.get('slug')
+        if slug and not slug.startswith('/') and '://' not in slug:
+            slug = f"/p/{slug}-{ean}" if not slug.endswith(ean) else f"/p/{slug}"
+        price = _find_value(attrs, 'price')
+        nutriscore = attrs.get('nutriscore')
+        if isinstance(nutriscore, dict):
+            nutriscore = nutriscore.get('value')
+        elif nutriscore is None:
+            nutriscore = _find_value(attrs, 'nutriscore')
+        promo = next((v for v in (_find_value(attrs, k) for k in API_PROMO_KEYS) if isinstance(v, str)), None)
+        return {
+            'name': self.clean_text(attrs.get('title') or attrs.get('name')),
+            'price': f"{price:.2f} €".replace('.', ',') if isinstance(price, (int, float)) else None,
+            'unit_price': self.clean_text(_find_value(attrs, 'perUnitLabel')),
+            'ean': ean if ean.isdigit() and len(ean) == 13 else None,
+            'nutriscore': nutriscore.upper() if isinstance(nutriscore, str) and len(nutriscore) == 1 else None,
+            'promo': self.clean_text(promo),
+            'url': urljoin("https://www.carrefour.fr", slug) if slug else None
+        }
+
+    async def extract_paginated_products(self, context, first_page, page_urls):
+        """Extract page 1, then fetch pages 2..N concurrently with a bounded page pool.
+
+        Once page N is done, "Page suivante" is followed from there in case the pager
+        only showed a window of the pages.
+
+        When a JSON API spotted during page 1 returns exactly the same rows as
+        page 1's grid, pages are fetched over plain HTTP first and only fall back to a
+        browser page if that yields nothing.
+        """
+        page1_rows = await self.read_page_rows(first_page)
+        await self.add_products(page1_rows)
+
+        sem = asyncio.Semaphore(self.config['max_parallel_pages'])
+        client = await self.open_api_client(context, page1_rows)
+
+        # Les pages finissent dans le désordre: leurs lignes attendent ici que toutes
+        # les pages précédentes soient écrites, pour garder l'ordre du site
+        pending = {}
+        next_index = 0
+        flush_lock = asyncio.Lock()
+
+        async def flush():
+            nonlocal next_index
+            async with flush_lock:
+                while next_index in pending:
+                    await self.add_products(pending.pop(next_index))
+                    next_index += 1
+
+        with tqdm(total=len(page_urls) + 1, desc="Chargement pages", initial=1) as pbar:
+            async def fetch_rows(page_url):
+                page_num = dict(parse_qsl(urlparse(page_url).query))['page']
+                if client is not None:
+                    rows = await self._fetch_api_rows(client, self._api_request[0], page_num)
+                    if rows:
+                        return rows
+
+                page = await context.new_page()
+                try:
+                    page = await self.navigate(page, page_url)
+                    await self.wait_for_products(page)
+                    return await self.read_page_rows(page)
+                except Exception as e:
+                    print(f"\n⚠️ Failed to load {page_url}: {e}")
+                    return []
+                finally:
+                    await page.close()
+
+            async def worker(index, page_url):
+                async with sem:
+                    pending[index] = await fetch_rows(page_url)
+                    pbar.update(1)
+                await flush()
+
+            try:
+                await asyncio.gather(*[worker(i, page_url) for i, page_url in enumerate(page_urls)])
+            finally:
+                if client is not None:
+                    await client.aclose()
 
-    def extract_all_products(self, page):
+            # Un pager fenêtré (1 2 3 … suivant) n'affiche pas la vraie dernière page:
+            # on repart de la dernière page connue et on suit "Page suivante" tant qu'il y en a
+            pbar.total += self.config['max_load_attempts']
+            pbar.refresh()
+            try:
+                page = await self.navigate(first_page, page_urls[-1])
+                await self.wait_for_products(page)
+            except Exception as e:
+                print(f"\n⚠️ Failed to load {page_urls[-1]}: {e}")
+                return
+            await self._loop_paginated(page, pbar)
+
+    async def extract_all_products(self, page):
         """Extract all products across all pages/load-more/infinite-scroll.
 
         Strategy:
         1) Extraire les produits visibles.
-        2) Tenter successivement:
+        2) Détecter une seule fois le mode de chargement de la liste:
            - bouton "Afficher les produits suivants" (load more)
            - pagination "Page suivante" (rel=next / aria-label)
            - défilement infini (scroll jusqu'à stabilisation)
-        3) Arrêter quand le nombre d'items n'augmente plus ou quand le max d'essais est atteint.
+        3) Boucler dans ce mode jusqu'à ce que le nombre d'items n'augmente plus
+           ou que le max d'essais soit atteint.
         """
-        attempts = 0
-        max_attempts = self.config['max_load_attempts']
+        mode = await self.detect_loading_mode(page)
+        loops = {
+            'loadmore': self._loop_loadmore,
+            'paginated': self._loop_paginated,
+            'infinite': self._loop_infinite
+        }
 
-        def products_count():
-            try:
-                return page.locator('li.product-list-grid__item').count()
-            except Exception:
-                return 0
-
-        def wait_for_increase(prev_count: int, timeout_ms: int = 15000, poll_ms: int = 300) -> bool:
-            start = time.time()
-            while (time.time() - start) * 1000 < timeout_ms:
-                new_count = products_count()
-                if new_count > prev_count:
-                    return True
-                page.wait_for_timeout(poll_ms)
+        with tqdm(total=self.config['max_load_attempts'], desc=f"Chargement pages ({mode})") as pbar:
+            # Toujours extraire la première vue
+            await self.extract_page_products(page)
+            await loops[mode](page, pbar)
+
+    async def detect_loading_mode(self, page):
+        """Probe page 1 once to know which loading strategy the listing uses"""
+        # La grille peut être attachée avant que les boutons ne soient hydratés: on leur laisse
+        # un court délai, sans quoi tout le run serait verrouillé en défilement infini
+        controls = ', '.join(LOAD_MORE_SELECTORS + NEXT_SELECTORS)
+        try:
+            await page.locator(controls).locator('visible=true').first.wait_for(
+                state='visible', timeout=LOADING_CONTROLS_WAIT_MS
+            )
+        except Exception:
+            return 'infinite'
+        try:
+            if await self._first_visible(page, LOAD_MORE_SELECTORS):
+                return 'loadmore'
+            if await self._first_visible(page, NEXT_SELECTORS):
+                return 'paginated'
+        except Exception:
+            pass
+        return 'infinite'
+
+    async def _first_visible(self, page, selectors):
+        """Locator of the highest-priority candidate that has a visible match, or None
+
+        Une union CSS prendrait le premier élément dans l'ordre du document, même caché
+        ou moins prioritaire (ex: flèche "Suivant" d'un carrousel avant a[rel=next]).
+        """
+        for sel in selectors:
+            loc = page.locator(sel).locator('visible=true').first
+            if await loc.count():
+                return loc
+        return None
+
+    async def _ready_control(self, page, current, selectors):
+        """`current` while it stays visible and enabled, otherwise the best candidate now on the page"""
+        if current is None or not await current.is_visible():
+            current = await self._first_visible(page, selectors)
+        if current is not None and await current.is_enabled():
+            return current
+        return None
+
+    async def _products_count(self, page):
+        try:
+            return await page.locator(PRODUCT_ITEM_SELECTOR).count()
+        except Exception:
+            return 0
+
+    async def _wait_for_increase(self, page, prev_count: int, timeout_ms: int = 15000) -> bool:
+        # Prédicat évalué dans le navigateur à chaque frame (pas d'aller-retour par sondage)
+        try:
+            await page.wait_for_function(
+                "([sel, prev]) => document.querySelectorAll(sel).length > prev",
+                arg=[PRODUCT_ITEM_SELECTOR, prev_count],
+                timeout=timeout_ms,
+                polling="raf"
+            )
+            return True
+        except Exception:
             return False
 
-        with tqdm(total=max_attempts, desc="Chargement pages") as pbar:
-            # Toujours extraire la première vue
-            self.extract_page_products(page)
+    async def _loop_loadmore(self, page, pbar):
+        """Click "Afficher les produits suivants" until no more items appear"""
+        load_more_btn = None
+        prev = await self._products_count(page)
 
-            while attempts < max_attempts:
-                attempts += 1
-                pbar.update(1)
+        for _ in range(self.config['max_load_attempts']):
+            pbar.update(1)
+            try:
+                load_more_btn = await self._ready_control(page, load_more_btn, LOAD_MORE_SELECTORS)
+                if load_more_btn is None:
+                    break
+                await self._retry(lambda: load_more_btn.click(timeout=self.config['timeout']))
+            except Exception:
+                break
+            if not await self._wait_for_increase(page, prev):
+                break
+            await self.extract_page_products(page, start_index=prev)
+            prev = await self._products_count(page)
 
-                prev = products_count()
+    async def _loop_paginated(self, page, pbar):
+        """Follow "Page suivante" until it disappears or a page brings nothing new"""
+        next_btn = None
 
-                # 1) Bouton "Afficher les produits suivants" (load more)
-                try:
-                    load_more_selectors = [
-                        'button[aria-label="Afficher les produits suivants"]',
-                        'button:has-text("Afficher les produits suivants")',
-                        'button:has-text("Voir plus")',
-                        'button:has-text("Afficher plus")'
-                    ]
-                    clicked = False
-                    for sel in load_more_selectors:
-                        btn = page.query_selector(sel)
-                        if btn and btn.is_enabled() and btn.is_visible():
-                            btn.click()
-                            clicked = True
-                            break
-                    if clicked:
-                        if wait_for_increase(prev):
-                            self.extract_page_products(page)
-                            continue
-                except Exception:
-                    pass
-
-                # 2) Pagination "Page suivante"
-                try:
-                    next_selectors = [
-                        'a[rel="next"]',
-                        'a[aria-label="Page suivante"]',
-                        'button[aria-label="Page suivante"]',
-                        'a:has-text("Suivant")',
-                        'button:has-text("Suivant")'
-                    ]
-                    clicked = False
-                    for sel in next_selectors:
-                        el = page.query_selector(sel)
-                        if el and el.is_enabled() and el.is_visible():
-                            el.click()
-                            clicked = True
-                            break
-                    if clicked:
-                        # Attendre navigation/réseau et augmentation des items
-                        try:
-                            page.wait_for_load_state("networkidle", timeout=self.config['timeout'])
-                        except Exception:
-                            pass
-                        if wait_for_increase(prev):
-                            self.extract_page_products(page)
-                            continue
-                except Exception:
-                    pass
-
-                # 3) Défilement infini
-                try:
-                    # Scroll par paliers jusqu'à ce que plus d'items n'apparaissent
-                    increased = False
-                    for _ in range(10):
-                        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                        page.wait_for_timeout(700)
-                        if products_count() > prev:
-                            increased = True
-                            prev = products_count()
-                        else:
-                            break
-                    if increased:
-                        self.extract_page_products(page)
-                        continue
-                except Exception:
-                    pass
-
-                # Rien de plus à charger
+        for _ in range(self.config['max_load_attempts']):
+            pbar.update(1)
+            try:
+                next_btn = await self._ready_control(page, next_btn, NEXT_SELECTORS)
+                if next_btn is None:
+                    break
+                # Lien avec href: navigation directe dans le même onglet (connexions et
+                # cache déjà chauds) plutôt qu'un clic suivi d'un re-rendu côté client
+                next_href = await next_btn.get_attribute('href')
+                if next_href:
+                    current = page
+                    page = await self.navigate(page, urljoin(page.url, next_href))
+                    if page is not current:
+                        next_btn = None
+                    await self.wait_for_products(page)
+                    start_index = 0
+                else:
+                    prev = await self._products_count(page)
+                    start_index = prev
+                    await self._retry(lambda: next_btn.click(timeout=self.config['timeout']))
+                    # Attendre le DOM de la nouvelle page puis l'augmentation des items
+                    try:
+                        await page.wait_for_load_state("domcontentloaded", timeout=self.config['timeout'])
+                    except Exception:
+                        pass
+                    if not await self._wait_for_increase(page, prev):
+                        break
+            except Exception:
+                break
+            if not await self.extract_page_products(page, start_index=start_index):
                 break
 
-    def extract_page_products(self, page):
-        """Extract products from current page"""
-        products = page.query_selector_all('li.product-list-grid__item')
-        
-        for product in products:
+    async def _loop_infinite(self, page, pbar):
+        """Scroll to the bottom until no more items are attached"""
+        prev = await self._products_count(page)
+
+        for _ in range(self.config['max_load_attempts']):
+            pbar.update(1)
             try:
-                product_data = {
-                    'name': self.safe_extract(product, '.product-list-card-plp-grid__title'),
-                    'price': self.extract_price(product),
-                    'unit_price': self.safe_extract(product, '.product-list-card-plp-grid__per-unit-label'),
-                    'ean': self.extract_ean(product),
-                    'nutriscore': self.extract_nutriscore(product),
-                    'promo': self.extract_promo(product),
-                    'url': self.extract_product_url(product)
-                }
-                
-                if not any(p.get('url') == product_data.get('url') for p in self.products):
-                    self.products.append(product_data)
-            except:
+                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+            except Exception:
+                break
+            if not await self._wait_for_increase(page, prev, timeout_ms=INFINITE_SCROLL_WAIT_MS):
+                break
+            await self.extract_page_products(page, start_index=prev)
+            prev = await self._products_count(page)
+
+    async def extract_page_products(self, page, start_index: int = 0):
+        """Extract products from current page, returning how many new products were added.
+
+        Only items from `start_index` on are read, so after a load-more or a scroll
+        the already processed head of the grid is not serialized again.
+        """
+        return await self.add_products(await self.read_page_rows(page, start_index))
+
+    async def read_page_rows(self, page, start_index: int = 0):
+        """Product rows of the grid from `start_index` on, without storing them"""
+        # Un seul aller-retour CDP: tous les champs de tous les produits sont lus côté navigateur
+        raw_products = await page.evaluate(PRODUCTS_JS, {
+            'itemSelector': PRODUCT_ITEM_SELECTOR,
+            'promoSelector': self._promo_sel,
+            'startIndex': start_index
+        })
+
+        # Post-traitement Python dans le pool: la boucle d'événements continue
+        # pendant ce temps à piloter les navigations des autres pages
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._postprocess_rows, raw_products)
+
+    async def add_products(self, rows):
+        """Keep the rows whose URL was not seen yet and store/write them"""
+        new_rows = []
+        async with self._lock:
+            for product_data in rows:
+                # Clé sans query/fragment: "?t=…" de suivi ne crée pas de doublon
+                key = _canonical_url(product_data['url'])
+                if key in self._seen_urls:
+                    continue
+                self._seen_urls.add(key)
+                new_rows.append(product_data)
+
+            self.record_stats(new_rows)
+            if self._writer is not None:
+                self.write_rows(new_rows)
+            else:
+                self.products.extend(new_rows)
+
+        return len(new_rows)
+
+    def _postprocess_rows(self, raw_products):
+        """Build product rows from raw in-page records (pure Python, runs in the thread pool)"""
+        rows = []
+        for raw in raw_products:
+            url = self.extract_product_url(raw)
+            if not url:
                 continue
+            rows.append({
+                'name': self.clean_text(raw.get('name')),
+                'price': self.extract_price(raw),
+                'unit_price': self.clean_text(raw.get('unit_price')),
+                'ean': self.extract_ean(raw, url),
+                'nutriscore': self.extract_nutriscore(raw),
+                'promo': self.extract_promo(raw),
+                'url': url
+            })
+        return rows
 
-    def safe_extract(self, parent, selector, attr=None):
-        """Safe data extraction"""
-        try:
-            element = parent.query_selector(selector)
-            if not element:
-                return None
-                
-            if attr:
-                return element.get_attribute(attr)
-                
-            text = element.inner_text().strip()
-            return ' '.join(text.split()) if text else None
-        except:
-            return None
+    def clean_text(self, text):
+        """Normalize whitespace of a raw innerText value"""
+        text = (text or '').strip()
+        return ' '.join(text.split()) if text else None
 
-    def extract_price(self, product_element):
+    def extract_price(self, raw):
         """Extract full price"""
-        try:
-            whole = self.safe_extract(product_element, '.product-price__content:nth-child(1)')
-            decimal = self.safe_extract(product_element, '.product-price__content:nth-child(2)')
-            currency = self.safe_extract(product_element, '.product-price__content:nth-child(3)')
-            
-            if whole and decimal and currency:
-                return f"{whole}{decimal} {currency.strip()}"
-            
-            return self.safe_extract(product_element, '.product-price__amount--main')
-        except:
-            return None
+        m = PRICE_RE.search(raw.get('price_raw') or '')
+        if m and m.group(3):
+            return f"{m.group(1)},{m.group(2)} {m.group(3)}"
+        
+        return self.clean_text(raw.get('price_main'))
 
-    def extract_ean(self, product_element):
+    def extract_ean(self, raw, url):
         """Extract EAN barcode"""
-        try:
-            article = product_element.query_selector('article')
-            if article:
-                article_id = article.get_attribute('id')
-                if article_id and article_id.isdigit() and len(article_id) == 13:
-                    return article_id
-            
-            url = self.extract_product_url(product_element)
-            if url:
-                ean = url.split('-')[-1]
-                if ean.isdigit() and len(ean) == 13:
-                    return ean
-            
-            return None
-        except:
-            return None
+        article_id = raw.get('article_id')
+        if article_id and article_id.isdigit() and len(article_id) == 13:
+            return article_id
+        
+        if url:
+            ean = url.split('-')[-1]
+            if ean.isdigit() and len(ean) == 13:
+                return ean
+        
+        return None
 
-    def extract_nutriscore(self, product_element):
+    def extract_nutriscore(self, raw):
         """Extract Nutri-Score"""
-        try:
-            img = product_element.query_selector('.nutriscore-badge img')
-            if img:
-                src = img.get_attribute('src')
-                if 'nutriscore' in src.lower():
-                    return src.split('-')[-1][0].upper()
-            return None
-        except:
-            return None
+        m = NUTRISCORE_RE.search(raw.get('nutriscore_src') or '')
+        return m.group(1).upper() if m else None
 
-    def extract_promo(self, product_element):
+    def extract_promo(self, raw):
         """Extract promotion info"""
-        try:
-            promo_selectors = [
-                '.sticker-promo__text',
-                '.product-card-badge__labels',
-                '.promo-badge',
-                '[class*="promotion"]',
-                '[class*="discount"]'
-            ]
-            
-            for selector in promo_selectors:
-                promo_text = self.safe_extract(product_element, selector)
-                if promo_text and any(x in promo_text.lower() for x in ['%', '€', 'offre', 'promo']):
-                    return promo_text
-            
-            old_price = self.safe_extract(product_element, '.product-price__amount--old')
-            if old_price:
-                return f"Ancien prix: {old_price}"
-            
-            return None
-        except:
-            return None
+        for promo_text in raw.get('promos') or []:
+            promo_text = self.clean_text(promo_text)
+            if promo_text and any(x in promo_text.lower() for x in ['%', '€', 'offre', 'promo']):
+                return promo_text
+        
+        old_price = self.clean_text(raw.get('old_price'))
+        if old_price:
+            return f"Ancien prix: {old_price}"
+        
+        return None
 
-    def extract_product_url(self, product_element):
+    def extract_product_url(self, raw):
         """Extract complete product URL"""
-        try:
-            path = product_element.query_selector('a[href^="/p/"]').get_attribute('href')
-            if path:
-                return urljoin("https://www.carrefour.fr", path)
-            return None
-        except:
-            return None
+        path = raw.get('href')
+        if path:
+            return urljoin("https://www.carrefour.fr", path)
+        return None
 
     def save_results(self, format_type, output_file=None):
         """Save results to file"""
         if not output_file:
             output_file = f"carrefour_products_{int(time.time())}.{format_type}"
         
-        df = pd.DataFrame(self.products)
-        
         try:
-            if format_type == 'csv':
-                df.to_csv(output_file, index=False, sep=';', encoding='utf-8-sig')
+            # CSV/TXT déjà écrits ligne par ligne pendant l'extraction: il ne reste qu'à publier le fichier
+            if self._streamed:
+                self.close_stream(keep=True)
             elif format_type == 'excel':
-                df.to_excel(output_file, index=False)
+                pd.DataFrame(self.products, columns=FIELDNAMES).to_excel(output_file, index=False, engine=EXCEL_ENGINE)
             elif format_type == 'json':
-                df.to_json(output_file, orient='records', indent=2)
-            elif format_type == 'txt':
-                df.to_csv(output_file, index=False, sep='\t', encoding='utf-8')
+                if orjson is not None:
+                    with open(output_file, 'wb') as f:
+                        f.write(orjson.dumps(self.products, option=orjson.OPT_INDENT_2))
+                else:
+                    with open(output_file, 'w', encoding='utf-8') as f:
+                        json.dump(self.products, f, ensure_ascii=False, indent=2)
             
             print(f"\n💾 Results saved to: {output_file}")
             
-            # Print summary to console
-            print("\n📊 Summary of extracted data:")
-            print(f"- Total products: {len(self.products)}")
-            if len(self.products) > 0:
-                print(f"- First product: {self.products[0]['name']}")
-                print(f"- Average price: {sum(float(p['price'].split()[0].replace(',', '.')) for p in self.products if p['price'])/len(self.products):.2f} €")
+            stats = self._stats
+            avg_price = stats['price_total'] / stats['price_count'] if stats['price_count'] else None
+            self.print_summary(len(self._seen_urls), stats['first_name'], avg_price)
             
         except Exception as e:
             print(f"\n❌ Error saving file: {str(e)}")
 
+    def print_summary(self, total, first_name, avg_price):
+        """Print summary to console"""
+        print("\n📊 Summary of extracted data:")
+        print(f"- Total products: {total}")
+        if total > 0:
+            print(f"- First product: {first_name}")
+            if avg_price is not None:
+                print(f"- Average price: {avg_price:.2f} €")
+
+def _find_value(obj, key):
+    """First scalar value stored under `key` anywhere in a nested JSON object"""
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            value = node.get(key)
+            if value is not None and not isinstance(value, (dict, list)):
+                return value
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return None
+
+def _canonical_url(url: str) -> str:
+    """Product URL used as dedup key: lowercase scheme/host, path only"""
+    if not url:
+        return url
+    parsed = urlparse(url)
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path, '', '', ''))
+
+def build_page_url(base_url: str, page_num: int) -> str:
+    parsed = urlparse(base_url)
+    q = dict(parse_qsl(parsed.query, keep_blank_values=True))
+    q['page'] = str(page_num)
+    new_query = urlencode(q, doseq=True)
+    return urlunparse((parsed.scheme, parsed.netloc, parsed.path, parsed.params, new_query, parsed.fragment))
+
 def main():
     parser = argparse.ArgumentParser(description="Carrefour Product Scraper CLI")
     def url_type(value: str):
@@ -1,37 +1,290 @@
 import argparse
+import atexit
+import asyncio
 from playwright.sync_api import sync_playwright
-import pandas as pd
+from playwright.async_api import async_playwright
 from urllib.parse import urljoin, urlparse, urlencode, parse_qsl, urlunparse
 import os
 import platform
 import re
+import struct
 import time
 from tqdm import tqdm
+import gzip
 import json
+import multiprocessing.util
+import csv
+from functools import lru_cache
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
+try:
+    from pybloom_live import ScalableBloomFilter
+except ImportError:
+    ScalableBloomFilter = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _canonicalize(url: str) -> str:
+    """Canonical form used for dedup: lowercase scheme/host, no fragment, sorted query"""
+    if not url:
+        return ''
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path, parsed.params, query, ''))
+
+
+# En-tête du fichier --seen-file: signature puis format du contenu (liste d'URLs ou filtre de Bloom)
+_SEEN_MAGIC = b'SCRAPC-SEEN 1\n'
+_SEEN_KIND_SET = b'set'
+_SEEN_KIND_BLOOM = b'bloom'
+
+
+class SeenUrls:
+    """URLs already handled. Those seen during this run are kept in an exact set, so dedup inside a
+    run never drops a new product. URLs from previous runs (--seen-file) come from a scalable Bloom
+    filter (~10 bits/URL): with a seen file, about 0.1% of genuinely new URLs can be taken for old ones.
+    Without pybloom_live the persisted file is a plain list of URLs and the check is exact."""
+
+    def __init__(self, initial_capacity: int = 10_000, error_rate: float = 0.001):
+        self._seen = set()
+        # Filtre des runs précédents, chargé par load(); None si aucun fichier
+        self._previous = None
+        self._initial_capacity = initial_capacity
+        self._error_rate = error_rate
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._seen or (self._previous is not None and url in self._previous)
+
+    def add(self, url: str):
+        self._seen.add(url)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    @classmethod
+    def load(cls, path: str | None):
+        """Reload the URLs saved by a previous run (empty if the file does not exist yet).
+
+        Raises ValueError when the file exists but cannot be read: it is then never
+        overwritten, so an unreadable history is not silently replaced by this run's URLs.
+        """
+        seen = cls()
+        if not path or not os.path.exists(path):
+            return seen
+        try:
+            with open(path, 'rb') as f:
+                if f.readline() != _SEEN_MAGIC:
+                    raise ValueError("en-tête absent, ce n'est pas un fichier --seen-file de ce scraper")
+                kind = f.readline().rstrip(b'\n')
+                if kind == _SEEN_KIND_SET:
+                    seen._previous = set(f.read().decode('utf-8').split())
+                elif kind == _SEEN_KIND_BLOOM:
+                    if ScalableBloomFilter is None:
+                        raise ValueError("filtre de Bloom: installez pybloom_live pour le relire")
+                    seen._previous = ScalableBloomFilter.fromfile(f)
+                else:
+                    raise ValueError(f"format {kind!r} inconnu")
+        except (OSError, EOFError, ValueError, UnicodeDecodeError, struct.error, MemoryError) as e:
+            raise ValueError(f"Fichier d'URLs déjà vues illisible ({path}): {e}") from e
+        return seen
+
+    def save(self, path: str):
+        """Persist previous runs' URLs plus this run's for the next invocation.
+
+        An existing plain-list file stays a plain list; new files use the Bloom filter when
+        pybloom_live is installed. The format is recorded in the header.
+        """
+        if ScalableBloomFilter is None or isinstance(self._previous, set):
+            kind = _SEEN_KIND_SET
+            merged = (self._previous or set()) | self._seen
+        else:
+            kind = _SEEN_KIND_BLOOM
+            merged = self._previous
+            if merged is None:
+                merged = ScalableBloomFilter(initial_capacity=self._initial_capacity, error_rate=self._error_rate)
+            for url in self._seen:
+                merged.add(url)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_SEEN_MAGIC + kind + b'\n')
+            if kind == _SEEN_KIND_BLOOM:
+                merged.tofile(f)
+            else:
+                f.write('\n'.join(merged).encode('utf-8'))
+        os.replace(tmp, path)
+
+
+PROMO_SELECTORS = [
+    '.sticker-promo__text',
+    '.product-card-badge__labels',
+    '.promo-badge',
+    '[class*="promotion"]',
+    '[class*="discount"]'
+]
+
+# Sélecteurs promo fusionnés en une union CSS: un seul querySelectorAll par produit (l'ordre n'importe pas)
+PROMO_SELECTOR = ', '.join(PROMO_SELECTORS)
+# Boutons "plus de produits" / "page suivante" par ordre de priorité: (sélecteur CSS, texte contenu ou None).
+# Résolus en un seul aller-retour par _FIRST_CONTROL_JS, qui garde le premier candidat visible et actif
+# (une union CSS prendrait le premier dans l'ordre du document, même caché ou moins prioritaire)
+LOAD_MORE_CANDIDATES = [
+    ('button[aria-label="Afficher les produits suivants"]', None),
+    ('button', 'Afficher les produits suivants'),
+    ('button', 'Voir plus'),
+    ('button', 'Afficher plus')
+]
+NEXT_CANDIDATES = [
+    ('a[rel="next"]', None),
+    ('a[aria-label="Page suivante"]', None),
+    ('button[aria-label="Page suivante"]', None),
+    ('a', 'Suivant'),
+    ('button', 'Suivant')
+]
+
+# Seuls les textes et l'attribut src (nutriscore) sont lus: pixels, polices, médias et trackers sont inutiles
+_BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font'}
+_BLOCKED_HOSTS = ('google-analytics', 'googletagmanager', 'doubleclick', 'criteo', 'facebook.net')
+
+
+def _block_resources(route):
+    request = route.request
+    if request.resource_type in _BLOCKED_RESOURCE_TYPES or any(h in request.url for h in _BLOCKED_HOSTS):
+        return route.abort()
+    return route.continue_()
+
+
+_PROMO_RE = re.compile(r'%|€|offre|promo', re.IGNORECASE)
+# a-e, ou u/unknown pour un produit non noté (-> "U", comme la version d'origine)
+_NUTRI_RE = re.compile(r'nutriscore[-_]([a-eu])', re.IGNORECASE)
+
+_PRICE_RE = re.compile(r'(\d+)(?:[.,](\d+))?')
+
+_COOKIE_BANNER_SELECTOR = '#onetrust-banner-sdk'
+# Équivalent de :has-text (insensible à la casse, espaces normalisés) + visible + non désactivé
+_FIRST_CONTROL_JS = """
+(candidates) => {
+    const norm = (t) => (t || '').replace(/\\s+/g, ' ').trim().toLowerCase();
+    const visible = (el) => el.checkVisibility
+        ? el.checkVisibility({visibilityProperty: true})
+        : el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden';
+    for (const [css, text] of candidates) {
+        for (const el of document.querySelectorAll(css)) {
+            if (text && !norm(el.textContent).includes(text.toLowerCase())) continue;
+            if (!el.disabled && visible(el)) return el;
+        }
+    }
+    return null;
+}
+"""
+_COUNT_JS = "document.querySelectorAll('li.product-list-grid__item').length"
+_COUNT_INCREASED_JS = "prev => document.querySelectorAll('li.product-list-grid__item').length > prev"
+
+# Tous les champs de tous les produits en un seul page.evaluate (au lieu de ~10 allers-retours CDP par produit)
+# start: index du premier produit non encore traité, le NodeList est tronqué avant sérialisation
+PRODUCTS_JS = """
+([promoSelector, start]) => Array.from(document.querySelectorAll('li.product-list-grid__item')).slice(start).map(li => {
+    const text = (sel) => li.querySelector(sel)?.innerText ?? null;
+    return {
+        name: text('.product-list-card-plp-grid__title'),
+        priceWhole: text('.product-price__content:nth-child(1)'),
+        priceDecimal: text('.product-price__content:nth-child(2)'),
+        priceCurrency: text('.product-price__content:nth-child(3)'),
+        priceMain: text('.product-price__amount--main'),
+        unit_price: text('.product-list-card-plp-grid__per-unit-label'),
+        ean: (li.querySelector('article')?.id?.match(/^\\d{13}$/) || [null])[0],
+        nutriscoreSrc: li.querySelector('.nutriscore-badge img')?.getAttribute('src') ?? null,
+        promos: Array.from(li.querySelectorAll(promoSelector), e => e.innerText),
+        oldPrice: text('.product-price__amount--old'),
+        href: li.querySelector('a[href^="/p/"]')?.getAttribute('href') ?? null
+    };
+})
+"""
+
+
 class CarrefourScraperCLI:
-    def __init__(self):
+    def __init__(self, seen_path: str | None = None):
         self.config = {
             'timeout': 30000,
             'headless': True,
             'user_agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             'max_load_attempts': 20
         }
+        # Les formats ligne à ligne (csv/txt/ndjson) sont écrits au fil de l'extraction;
+        # seuls json/excel gardent les produits en mémoire jusqu'à save_results
         self.products = []
-        self.seen_urls = set()
-
-    def run(self, url, output_format='csv', output_file=None, single_page_only: bool = False):
+        self.product_count = 0
+        self._writer = None
+        self._stats = {'first_name': None, 'price_total': 0.0, 'price_count': 0}
+        # URLs canoniques ajoutées pendant ce run, tenues seulement quand un worker doit les remonter
+        self.new_urls = None
+        # Avec seen_path, les URLs déjà extraites lors d'un run précédent sont ignorées
+        self.seen_path = seen_path
+        self.seen_urls = SeenUrls.load(seen_path)
+
+    def run(self, url, output_format='csv', output_file=None, single_page_only: bool = False, browser=None):
         print(f"\n🚀 Starting Carrefour Scraper for URL: {url}")
         start_time = time.time()
+        if not output_file:
+            output_file = f"carrefour_products_{int(start_time)}.{output_format}"
+        self.open_stream(output_format, output_file)
 
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=self.config['headless'])
-            context = browser.new_context(user_agent=self.config['user_agent'])
+        try:
+            if browser is not None:
+                # Navigateur partagé (worker du pool): seul le contexte est propre à cette URL
+                self.scrape(browser, url, single_page_only)
+            else:
+                with sync_playwright() as p:
+                    browser = p.chromium.launch(headless=self.config['headless'])
+                    try:
+                        self.scrape(browser, url, single_page_only)
+                    finally:
+                        browser.close()
+        except BaseException:
+            self.close_stream(keep=False)
+            raise
+
+        duration = time.time() - start_time
+        print(f"\n✅ Completed! Found {self.product_count} products in {duration:.2f} seconds")
+
+        saved = False
+        if self.product_count:
+            saved = self.save_results(output_format, output_file)
+        else:
+            self.close_stream(keep=False)
+            print("⚠️ No products found - check the URL or try again")
+
+        # URLs retenues seulement une fois la sortie publiée: sinon un échec les ferait ignorer à jamais
+        if saved and self.seen_path:
+            self.seen_urls.save(self.seen_path)
+        return saved
+
+    def open_stream(self, format_type, output_file):
+        """Write rows to output_file as they are extracted when the format allows it"""
+        if format_type in _STREAMED_FORMATS:
+            self._writer = ProductWriter(format_type, output_file)
+
+    def close_stream(self, keep: bool):
+        """Publish (keep=True) or drop the streamed file"""
+        if self._writer is None:
+            return
+        if keep:
+            self._writer.commit()
+        else:
+            self._writer.discard()
+        self._writer = None
+
+    def scrape(self, browser, url, single_page_only: bool = False):
+        context = browser.new_context(user_agent=self.config['user_agent'])
+        try:
+            context.route("**/*", _block_resources)
             page = context.new_page()
 
             print("\n🌐 Navigating to page...")
-            page.goto(url, wait_until="networkidle", timeout=self.config['timeout'])
+            page.goto(url, wait_until="domcontentloaded", timeout=self.config['timeout'])
 
             self.handle_cookies(page)
             try:
@@ -44,24 +297,20 @@ class CarrefourScraperCLI:
                 self.extract_page_products(page, start_index=0)
             else:
                 self.extract_all_products(page)
-
-            browser.close()
-
-        duration = time.time() - start_time
-        print(f"\n✅ Completed! Found {len(self.products)} products in {duration:.2f} seconds")
-
-        if self.products:
-            self.save_results(output_format, output_file)
-        else:
-            print("⚠️ No products found - check the URL or try again")
+        finally:
+            context.close()
 
     def handle_cookies(self, page):
         try:
             page.click('#onetrust-reject-all-handler', timeout=3000)
             print("✓ Handled cookie consent")
-            page.wait_for_timeout(1000)
-        except:
+        except Exception:
             print("⚠️ Could not find cookie consent banner")
+            return
+        # On attend la disparition du bandeau plutôt qu'une pause fixe d'1 s
+        try:
+            page.wait_for_selector(_COOKIE_BANNER_SELECTOR, state='hidden', timeout=3000)
+        except Exception:
             pass
 
     def extract_all_products(self, page):
@@ -70,18 +319,17 @@ class CarrefourScraperCLI:
 
         def products_count():
             try:
-                return page.locator('li.product-list-grid__item').count()
+                return page.evaluate(_COUNT_JS)
             except Exception:
                 return 0
 
-        def wait_for_increase(prev_count: int, timeout_ms: int = 15000, poll_ms: int = 300) -> bool:
-            start = time.time()
-            while (time.time() - start) * 1000 < timeout_ms:
-                new_count = products_count()
-                if new_count > prev_count:
-                    return True
-                page.wait_for_timeout(poll_ms)
-            return False
+        def wait_for_increase(prev_count: int, timeout_ms: int = 15000) -> bool:
+            # Condition évaluée dans la page: un seul aller-retour CDP au lieu d'un par poll
+            try:
+                page.wait_for_function(_COUNT_INCREASED_JS, arg=prev_count, timeout=timeout_ms)
+                return True
+            except Exception:
+                return False
 
         with tqdm(total=max_attempts, desc="Chargement pages") as pbar:
             self.extract_page_products(page, start_index=0)
@@ -94,20 +342,9 @@ class CarrefourScraperCLI:
 
                 # Load more
                 try:
-                    load_more_selectors = [
-                        'button[aria-label="Afficher les produits suivants"]',
-                        'button:has-text("Afficher les produits suivants")',
-                        'button:has-text("Voir plus")',
-                        'button:has-text("Afficher plus")'
-                    ]
-                    clicked = False
-                    for sel in load_more_selectors:
-                        btn = page.query_selector(sel)
-                        if btn and btn.is_enabled() and btn.is_visible():
-                            btn.click()
-                            clicked = True
-                            break
-                    if clicked:
+                    btn = page.evaluate_handle(_FIRST_CONTROL_JS, LOAD_MORE_CANDIDATES).as_element()
+                    if btn:
+                        btn.click()
                         if wait_for_increase(prev):
                             self.extract_page_products(page, start_index=prev)
                             continue
@@ -116,26 +353,10 @@ class CarrefourScraperCLI:
 
                 # Next page
                 try:
-                    next_selectors = [
-                        'a[rel="next"]',
-                        'a[aria-label="Page suivante"]',
-                        'button[aria-label="Page suivante"]',
-                        'a:has-text("Suivant")',
-                        'button:has-text("Suivant")'
-                    ]
-                    clicked = False
-                    for sel in next_selectors:
-                        el = page.query_selector(sel)
-                        if el and el.is_enabled() and el.is_visible():
-                            el.click()
-                            clicked = True
-                            break
-                    if clicked:
-                        try:
-                            page.wait_for_load_state("networkidle", timeout=self.config['timeout'])
-                        except Exception:
-                            pass
-                        if wait_for_increase(prev):
+                    el = page.evaluate_handle(_FIRST_CONTROL_JS, NEXT_CANDIDATES).as_element()
+                    if el:
+                        el.click()
+                        if wait_for_increase(prev, timeout_ms=self.config['timeout']):
                             self.extract_page_products(page, start_index=prev)
                             continue
                 except Exception:
@@ -143,17 +364,14 @@ class CarrefourScraperCLI:
 
                 # Infinite scroll
                 try:
-                    increased = False
+                    base = prev
                     for _ in range(10):
                         page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                        page.wait_for_timeout(700)
-                        if products_count() > prev:
-                            increased = True
-                            prev = products_count()
-                        else:
+                        if not wait_for_increase(prev, timeout_ms=700):
                             break
-                    if increased:
-                        self.extract_page_products(page, start_index=prev)
+                        prev = products_count()
+                    if prev > base:
+                        self.extract_page_products(page, start_index=base)
                         continue
                 except Exception:
                     pass
@@ -161,138 +379,375 @@ class CarrefourScraperCLI:
                 break
 
     def extract_page_products(self, page, start_index: int = 0):
-        products = page.query_selector_all('li.product-list-grid__item')
-        if start_index > 0:
-            products = products[start_index:]
+        self.add_records(page.evaluate(PRODUCTS_JS, [PROMO_SELECTOR, start_index]))
 
-        for product in products:
-            try:
-                product_data = {
-                    'name': self.safe_extract(product, '.product-list-card-plp-grid__title'),
-                    'price': self.extract_price(product),
-                    'unit_price': self.safe_extract(product, '.product-list-card-plp-grid__per-unit-label'),
-                    'ean': self.extract_ean(product),
-                    'nutriscore': self.extract_nutriscore(product),
-                    'promo': self.extract_promo(product),
-                    'url': self.extract_product_url(product)
-                }
-                url = product_data.get('url')
-                if url and url not in self.seen_urls:
-                    self.products.append(product_data)
-                    self.seen_urls.add(url)
-            except:
+    def add_records(self, records):
+        rows = []
+        for r in records:
+            url = self.extract_product_url(r)
+            if not url:
                 continue
-
-    def safe_extract(self, parent, selector, attr=None):
-        try:
-            element = parent.query_selector(selector)
-            if not element:
-                return None
-            if attr:
-                return element.get_attribute(attr)
-            text = element.inner_text().strip()
-            return ' '.join(text.split()) if text else None
-        except:
-            return None
-
-    def extract_price(self, product_element):
-        try:
-            whole = self.safe_extract(product_element, '.product-price__content:nth-child(1)')
-            decimal = self.safe_extract(product_element, '.product-price__content:nth-child(2)')
-            currency = self.safe_extract(product_element, '.product-price__content:nth-child(3)')
-            if whole and decimal and currency:
-                return f"{whole}{decimal} {currency.strip()}"
-            return self.safe_extract(product_element, '.product-price__amount--main')
-        except:
-            return None
-
-    def extract_ean(self, product_element):
-        try:
-            article = product_element.query_selector('article')
-            if article:
-                article_id = article.get_attribute('id')
-                if article_id and article_id.isdigit() and len(article_id) == 13:
-                    return article_id
-            url = self.extract_product_url(product_element)
-            if url:
-                ean = url.split('-')[-1]
-                if ean.isdigit() and len(ean) == 13:
-                    return ean
-            return None
-        except:
-            return None
-
-    def extract_nutriscore(self, product_element):
-        try:
-            img = product_element.query_selector('.nutriscore-badge img')
-            if img:
-                src = img.get_attribute('src')
-                if 'nutriscore' in src.lower():
-                    return src.split('-')[-1][0].upper()
-            return None
-        except:
-            return None
-
-    def extract_promo(self, product_element):
-        try:
-            promo_selectors = [
-                '.sticker-promo__text',
-                '.product-card-badge__labels',
-                '.promo-badge',
-                '[class*="promotion"]',
-                '[class*="discount"]'
-            ]
-            for selector in promo_selectors:
-                promo_text = self.safe_extract(product_element, selector)
-                if promo_text and any(x in promo_text.lower() for x in ['%', '€', 'offre', 'promo']):
-                    return promo_text
-            old_price = self.safe_extract(product_element, '.product-price__amount--old')
-            if old_price:
-                return f"Ancien prix: {old_price}"
-            return None
-        except:
-            return None
-
-    def extract_product_url(self, product_element):
-        try:
-            path = product_element.query_selector('a[href^="/p/"]').get_attribute('href')
-            if path:
-                return urljoin("https://www.carrefour.fr", path)
-            return None
-        except:
-            return None
+            cu = _canonicalize(url)
+            if cu in self.seen_urls:
+                continue
+            self.seen_urls.add(cu)
+            if self.new_urls is not None:
+                self.new_urls.append(cu)
+            rows.append({
+                'name': self.clean_text(r.get('name')),
+                'price': self.extract_price(r),
+                'unit_price': self.clean_text(r.get('unit_price')),
+                'ean': self.extract_ean(r, url),
+                'nutriscore': self.extract_nutriscore(r),
+                'promo': self.extract_promo(r),
+                'url': url
+            })
+        self.product_count += len(rows)
+        self.record_stats(rows)
+        if self._writer is not None:
+            self._writer.write(rows)
+        else:
+            self.products.extend(rows)
+
+    def record_stats(self, rows):
+        """Running figures for the summary, so streamed products need no second pass"""
+        stats = self._stats
+        if stats['first_name'] is None and rows:
+            stats['first_name'] = rows[0]['name']
+        for p in rows:
+            m = _PRICE_RE.match(p['price']) if p['price'] else None
+            if m:
+                stats['price_total'] += float(f"{m.group(1)}.{m.group(2) or 0}")
+                stats['price_count'] += 1
+
+    def clean_text(self, text):
+        text = (text or '').strip()
+        return ' '.join(text.split()) if text else None
+
+    def extract_price(self, r):
+        whole = self.clean_text(r.get('priceWhole'))
+        decimal = self.clean_text(r.get('priceDecimal'))
+        currency = self.clean_text(r.get('priceCurrency'))
+        if whole and decimal and currency:
+            return f"{whole}{decimal} {currency}"
+        return self.clean_text(r.get('priceMain'))
+
+    def extract_ean(self, r, url):
+        if r.get('ean'):
+            return r['ean']
+        if url:
+            ean = url.split('-')[-1]
+            if ean.isdigit() and len(ean) == 13:
+                return ean
+        return None
+
+    def extract_nutriscore(self, r):
+        m = _NUTRI_RE.search(r.get('nutriscoreSrc') or '')
+        return m.group(1).upper() if m else None
+
+    def extract_promo(self, r):
+        for promo_text in r.get('promos') or []:
+            promo_text = self.clean_text(promo_text)
+            if promo_text and _PROMO_RE.search(promo_text):
+                return promo_text
+        old_price = self.clean_text(r.get('oldPrice'))
+        if old_price:
+            return f"Ancien prix: {old_price}"
+        return None
+
+    def extract_product_url(self, r):
+        path = r.get('href')
+        if path:
+            return urljoin("https://www.carrefour.fr", path)
+        return None
 
     def save_results(self, format_type, output_file=None):
         if not output_file:
             output_file = f"carrefour_products_{int(time.time())}.{format_type}"
-        df = pd.DataFrame(self.products)
         try:
-            if format_type == 'csv':
-                df.to_csv(output_file, index=False, sep=';', encoding='utf-8-sig')
-            elif format_type == 'excel':
-                df.to_excel(output_file, index=False)
-            elif format_type == 'json':
-                df.to_json(output_file, orient='records', indent=2)
-            elif format_type == 'txt':
-                df.to_csv(output_file, index=False, sep='\t', encoding='utf-8')
+            if self._writer is not None:
+                # Lignes déjà écrites pendant l'extraction: il ne reste qu'à publier le fichier
+                self.close_stream(keep=True)
+            else:
+                _write_products(self.products, format_type, output_file)
+            stats = self._stats
             print(f"\n💾 Results saved to: {output_file}")
             print("\n📊 Summary of extracted data:")
-            print(f"- Total products: {len(self.products)}")
-            if len(self.products) > 0:
-                print(f"- First product: {self.products[0]['name']}")
+            print(f"- Total products: {self.product_count}")
+            if self.product_count > 0:
+                print(f"- First product: {stats['first_name']}")
+                n = stats['price_count']
+                print(f"- Average price: {stats['price_total'] / n if n else 0:.2f} €")
+            return True
+        except Exception as e:
+            self.close_stream(keep=False)
+            print(f"\n❌ Error saving file: {str(e)}")
+            return False
+
+
+class AsyncCarrefourScraperCLI(CarrefourScraperCLI):
+    """Async variant: same extraction, every page call awaited so several pages can load at once."""
+
+    async def run(self, url, output_format='csv', output_file=None, single_page_only: bool = False, browser=None):
+        print(f"\n🚀 Starting Carrefour Scraper for URL: {url}")
+        start_time = time.time()
+        if not output_file:
+            output_file = f"carrefour_products_{int(start_time)}.{output_format}"
+        self.open_stream(output_format, output_file)
+
+        try:
+            if browser is not None:
+                await self.scrape(browser, url, single_page_only)
+            else:
+                async with async_playwright() as p:
+                    browser = await p.chromium.launch(headless=self.config['headless'])
+                    try:
+                        await self.scrape(browser, url, single_page_only)
+                    finally:
+                        await browser.close()
+        except BaseException:
+            self.close_stream(keep=False)
+            raise
+
+        duration = time.time() - start_time
+        print(f"\n✅ Completed! Found {self.product_count} products in {duration:.2f} seconds")
+
+        saved = False
+        if self.product_count:
+            saved = self.save_results(output_format, output_file)
+        else:
+            self.close_stream(keep=False)
+            print("⚠️ No products found - check the URL or try again")
+
+        # URLs retenues seulement une fois la sortie publiée: sinon un échec les ferait ignorer à jamais
+        if saved and self.seen_path:
+            self.seen_urls.save(self.seen_path)
+        return saved
+
+    async def scrape(self, browser, url, single_page_only: bool = False):
+        """Scrape one listing URL in its own context of an already launched browser"""
+        context = await browser.new_context(user_agent=self.config['user_agent'])
+        try:
+            await context.route("**/*", _block_resources)
+            page = await context.new_page()
+
+            print("\n🌐 Navigating to page...")
+            await page.goto(url, wait_until="domcontentloaded", timeout=self.config['timeout'])
+
+            await self.handle_cookies(page)
+            try:
+                await page.wait_for_selector('li.product-list-grid__item', timeout=10000)
+            except Exception:
+                pass
+
+            print("\n🔍 Extracting products...")
+            if single_page_only:
+                await self.extract_page_products(page, start_index=0)
+            else:
+                await self.extract_all_products(page)
+        finally:
+            await context.close()
+
+    async def handle_cookies(self, page):
+        try:
+            await page.click('#onetrust-reject-all-handler', timeout=3000)
+            print("✓ Handled cookie consent")
+        except Exception:
+            print("⚠️ Could not find cookie consent banner")
+            return
+        # On attend la disparition du bandeau plutôt qu'une pause fixe d'1 s
+        try:
+            await page.wait_for_selector(_COOKIE_BANNER_SELECTOR, state='hidden', timeout=3000)
+        except Exception:
+            pass
+
+    async def extract_all_products(self, page):
+        attempts = 0
+        max_attempts = self.config['max_load_attempts']
+
+        async def products_count():
+            try:
+                return await page.evaluate(_COUNT_JS)
+            except Exception:
+                return 0
+
+        async def wait_for_increase(prev_count: int, timeout_ms: int = 15000) -> bool:
+            try:
+                await page.wait_for_function(_COUNT_INCREASED_JS, arg=prev_count, timeout=timeout_ms)
+                return True
+            except Exception:
+                return False
+
+        with tqdm(total=max_attempts, desc="Chargement pages") as pbar:
+            await self.extract_page_products(page, start_index=0)
+
+            while attempts < max_attempts:
+                attempts += 1
+                pbar.update(1)
+
+                prev = await products_count()
+
+                # Load more
                 try:
-                    avg_price = sum(float(p['price'].split()[0].replace(',', '.')) for p in self.products if p.get('price'))/max(1, len(self.products))
-                    print(f"- Average price: {avg_price:.2f} €")
+                    btn = (await page.evaluate_handle(_FIRST_CONTROL_JS, LOAD_MORE_CANDIDATES)).as_element()
+                    if btn:
+                        await btn.click()
+                        if await wait_for_increase(prev):
+                            await self.extract_page_products(page, start_index=prev)
+                            continue
+                except Exception:
+                    pass
+
+                # Next page
+                try:
+                    el = (await page.evaluate_handle(_FIRST_CONTROL_JS, NEXT_CANDIDATES)).as_element()
+                    if el:
+                        await el.click()
+                        if await wait_for_increase(prev, timeout_ms=self.config['timeout']):
+                            await self.extract_page_products(page, start_index=prev)
+                            continue
+                except Exception:
+                    pass
+
+                # Infinite scroll
+                try:
+                    base = prev
+                    for _ in range(10):
+                        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                        if not await wait_for_increase(prev, timeout_ms=700):
+                            break
+                        prev = await products_count()
+                    if prev > base:
+                        await self.extract_page_products(page, start_index=base)
+                        continue
                 except Exception:
                     pass
-        except Exception as e:
-            print(f"\n❌ Error saving file: {str(e)}")
 
+                break
+
+    async def extract_page_products(self, page, start_index: int = 0):
+        self.add_records(await page.evaluate(PRODUCTS_JS, [PROMO_SELECTOR, start_index]))
+
+
+_FIELDNAMES = ['name', 'price', 'unit_price', 'ean', 'nutriscore', 'promo', 'url']
+# Formats écrits ligne à ligne: (séparateur CSV ou None pour NDJSON, encodage)
+_STREAMED_FORMATS = {'csv': (';', 'utf-8-sig'), 'txt': ('\t', 'utf-8'), 'ndjson': (None, 'utf-8')}
+
+
+def _json_line(product) -> str:
+    if orjson is not None:
+        return orjson.dumps(product).decode('utf-8') + '\n'
+    return json.dumps(product, ensure_ascii=False) + '\n'
+
+
+def _json_loads(line: str):
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+class ProductWriter:
+    """Row-by-row CSV/TXT/NDJSON writer into a temp file; commit() moves it onto output_file
+    with os.replace, discard() removes it. A .gz output name is gzip-compressed."""
+
+    def __init__(self, format_type: str, output_file: str):
+        root, ext = os.path.splitext(output_file)
+        self.output_file = output_file
+        self.tmp = f"{root}.tmp{ext}"
+        sep, enc = _STREAMED_FORMATS[format_type]
+        opener = gzip.open if output_file.endswith('.gz') else open
+        self._file = opener(self.tmp, 'wt', newline='', encoding=enc)
+        self._csv = None
+        if sep is not None:
+            self._csv = csv.DictWriter(self._file, fieldnames=_FIELDNAMES, delimiter=sep, lineterminator=os.linesep)
+            self._csv.writeheader()
+
+    def write(self, rows):
+        if self._csv is not None:
+            self._csv.writerows(rows)
+        else:
+            self._file.writelines(_json_line(r) for r in rows)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.tmp, self.output_file)
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.tmp):
+            os.unlink(self.tmp)
+
+
+def _write_products(products, format_type: str, output_file: str):
+    # CSV/TXT/JSON écrits directement depuis la liste de dicts; pandas seulement pour Excel
+    # Écriture dans un fichier temporaire puis os.replace: jamais de fichier partiel visible
+    if format_type in _STREAMED_FORMATS:
+        writer = ProductWriter(format_type, output_file)
+        try:
+            writer.write(products)
+        except BaseException:
+            writer.discard()
+            raise
+        writer.commit()
+        return
+    root, ext = os.path.splitext(output_file)
+    tmp = f"{root}.tmp{ext}"
+    try:
+        if format_type == 'json':
+            if orjson is not None:
+                with open(tmp, 'wb') as f:
+                    f.write(orjson.dumps(products, option=orjson.OPT_INDENT_2))
+            else:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(products, f, ensure_ascii=False, indent=2)
+        elif format_type == 'excel':
+            import pandas as pd  # import paresseux: seul l'export Excel en a besoin
+            pd.DataFrame(products, columns=_FIELDNAMES).to_excel(tmp, index=False)
+        else:
+            return
+        os.replace(tmp, output_file)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _merge_shards(shard_files, format_type: str, output_file: str, seen: SeenUrls) -> int:
+    """Stream NDJSON shard files into output_file, keeping the first occurrence of each URL"""
+    writer = ProductWriter(format_type, output_file) if format_type in _STREAMED_FORMATS else None
+    buffered = []
+    count = 0
+    try:
+        for path in shard_files:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    product = _json_loads(line)
+                    cu = _canonicalize(product.get('url'))
+                    if not cu or cu in seen:
+                        continue
+                    seen.add(cu)
+                    count += 1
+                    if writer is not None:
+                        writer.write((product,))
+                    else:
+                        buffered.append(product)
+    except BaseException:
+        if writer is not None:
+            writer.discard()
+        raise
+    if writer is not None:
+        writer.commit()
+    else:
+        _write_products(buffered, format_type, output_file)
+    return count
 
+
+_SLUG_RE = re.compile(r'[^a-zA-Z0-9]+')
+
+
+@lru_cache(maxsize=1024)
 def _slugify_url(url: str) -> str:
     parsed = urlparse(url)
     path = parsed.path.replace('/', '_').strip('_')
-    query = re.sub(r'[^a-zA-Z0-9]+', '_', parsed.query).strip('_')
+    query = _SLUG_RE.sub('_', parsed.query).strip('_')
     base = f"{parsed.netloc}_{path}" if path else parsed.netloc
     if query:
         base = f"{base}_{query[:80]}"
@@ -306,9 +761,41 @@ def _ensure_output_path(output_dir: str | None, file_name: str) -> str:
     return file_name
 
 
+# Un seul Chromium par processus worker, réutilisé pour toutes les URLs qui lui sont confiées
+_WORKER_PLAYWRIGHT = None
+_WORKER_BROWSER = None
+
+
+def _close_worker_browser():
+    global _WORKER_PLAYWRIGHT, _WORKER_BROWSER
+    try:
+        if _WORKER_BROWSER is not None:
+            _WORKER_BROWSER.close()
+        if _WORKER_PLAYWRIGHT is not None:
+            _WORKER_PLAYWRIGHT.stop()
+    except Exception:
+        pass
+    _WORKER_PLAYWRIGHT = _WORKER_BROWSER = None
+
+
+def _get_browser(headless: bool):
+    global _WORKER_PLAYWRIGHT, _WORKER_BROWSER
+    if _WORKER_BROWSER is None:
+        _WORKER_PLAYWRIGHT = sync_playwright().start()
+        _WORKER_BROWSER = _WORKER_PLAYWRIGHT.chromium.launch(headless=headless)
+        # atexit pour un appel direct; Finalize car les workers du pool sortent via os._exit
+        atexit.register(_close_worker_browser)
+        multiprocessing.util.Finalize(None, _close_worker_browser, exitpriority=10)
+    return _WORKER_BROWSER
+
+
 def process_url_task(task):
-    url, fmt, output_dir, no_headless, max_attempts, single_page_only, output_file, return_products = task
+    url, fmt, output_dir, no_headless, max_attempts, single_page_only, output_file, seen_path = task
     scraper = CarrefourScraperCLI()
+    if seen_path:
+        # Lecture seule dans le worker: le processus principal fusionne et sauvegarde
+        scraper.seen_urls = SeenUrls.load(seen_path)
+        scraper.new_urls = []
     if no_headless:
         scraper.config['headless'] = False
     if max_attempts is not None and max_attempts > 0:
@@ -319,23 +806,53 @@ def process_url_task(task):
         if on_linux and not has_display:
             print("[INFO] Aucun serveur X détecté (DISPLAY absent) → forçage du mode headless.")
             scraper.config['headless'] = True
-    if output_file:
-        out_file = output_file
-    else:
-        stamp = int(time.time())
-        base = _slugify_url(url)
-        out_file = _ensure_output_path(output_dir, f"{base}_{stamp}.{fmt}")
-    scraper.run(url, fmt, out_file, single_page_only=single_page_only)
+    # Nom dérivé de l'URL seulement si aucun fichier de sortie n'est imposé
+    out_file = output_file or _ensure_output_path(output_dir, f"{_slugify_url(url)}_{int(time.time())}.{fmt}")
+    browser = _get_browser(scraper.config['headless'])
+    saved = scraper.run(url, fmt, out_file, single_page_only=single_page_only, browser=browser)
     result = {
         'url': url,
         'output': out_file,
-        'count': len(scraper.products)
+        'count': scraper.product_count
     }
-    if return_products:
-        result['products'] = scraper.products
+    if seen_path and saved:
+        result['seen'] = scraper.new_urls
     return result
 
 
+async def _scrape_one(browser, url, out_file, sem):
+    async with sem:
+        scraper = AsyncCarrefourScraperCLI()
+        scraper.open_stream('ndjson', out_file)
+        try:
+            await scraper.scrape(browser, url, single_page_only=True)
+        except Exception as e:
+            scraper.close_stream(keep=False)
+            return {'url': url, 'error': e}
+        scraper.close_stream(keep=scraper.product_count > 0)
+        return {'url': url, 'count': scraper.product_count, 'output': out_file}
+
+
+async def _run_all(shards, workers: int, headless: bool):
+    """Scrape all (url, ndjson_file) shards concurrently from one Chromium, one context per shard."""
+    results = []
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless)
+        sem = asyncio.Semaphore(max(1, workers))
+        try:
+            # Résultats traités dans l'ordre d'arrivée: un shard rapide n'attend pas les plus lents
+            for fut in asyncio.as_completed([_scrape_one(browser, u, out, sem) for u, out in shards]):
+                res = await fut
+                if 'error' in res:
+                    print(f"[ERREUR] shard {res['url']} → {res['error']}")
+                else:
+                    results.append(res)
+                    print(f"[OK] shard {res['url']} → {res['count']} produits")
+        finally:
+            await browser.close()
+    return results
+
+
 def build_page_url(base_url: str, page_num: int) -> str:
     parsed = urlparse(base_url)
     q = dict(parse_qsl(parsed.query, keep_blank_values=True))
@@ -362,13 +879,21 @@ def main():
     parser.add_argument('--workers', type=int, default=3, help="Nombre de tâches parallèles (multi-URL ou mono-URL sharding)")
     parser.add_argument('--parallel-single', action='store_true', help="Activer le parallélisme sur un seul lien en shardant par pages")
     parser.add_argument('--max-pages', type=int, default=12, help="Nombre maximum de pages à sharder pour un seul lien (si --parallel-single)")
+    parser.add_argument('--seen-file', help="Fichier (filtre de Bloom) des URLs produits déjà extraites: ignorées aux runs suivants")
+    parser.add_argument('--process-pool', action='store_true', help="Avec --parallel-single: un processus (et un navigateur) par shard au lieu d'un navigateur partagé")
 
     args = parser.parse_args()
+    if args.seen_file:
+        # Fichier illisible: arrêt avant tout scraping plutôt que d'écraser l'historique
+        try:
+            SeenUrls.load(args.seen_file)
+        except ValueError as e:
+            parser.error(str(e))
 
     if len(args.urls) == 1:
         url = args.urls[0]
         if not args.parallel_single:
-            scraper = CarrefourScraperCLI()
+            scraper = AsyncCarrefourScraperCLI(seen_path=args.seen_file)
             if args.no_headless:
                 scraper.config['headless'] = False
             if args.max_attempts is not None and args.max_attempts > 0:
@@ -379,55 +904,57 @@ def main():
                 if on_linux and not has_display:
                     print("[INFO] Aucun serveur X détecté (DISPLAY absent) → forçage du mode headless.")
                     scraper.config['headless'] = True
-            scraper.run(url, args.format, args.output)
+            asyncio.run(scraper.run(url, args.format, args.output))
             return
         else:
             print(f"[INFO] Parallélisation mono-URL activée → {args.workers} workers, {args.max_pages} pages max")
             shard_urls = [build_page_url(url, p) for p in range(1, max(2, args.max_pages) + 1)]
-            tasks = []
-            for shard in shard_urls:
-                tasks.append((shard, args.format, args.output_dir, args.no_headless, args.max_attempts, True, None, True))
-            results = []
-            with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
-                future_map = {executor.submit(process_url_task, t): t[0] for t in tasks}
-                for future in as_completed(future_map):
-                    su = future_map[future]
-                    try:
-                        res = future.result()
-                        results.append(res)
-                        print(f"[OK] shard {su} → {res['count']} produits")
-                    except Exception as e:
-                        print(f"[ERREUR] shard {su} → {e}")
-            all_products = []
-            seen = set()
-            for r in results:
-                for p in r.get('products', []) if r.get('products') else []:
-                    u = p.get('url')
-                    if u and u not in seen:
-                        seen.add(u)
-                        all_products.append(p)
-            print(f"\n✅ Fusion des shards: {len(all_products)} produits uniques")
+            # Chaque shard écrit son propre NDJSON au fil de l'extraction; la fusion les relit ligne à ligne
+            stamp = int(time.time())
+            shard_files = [_ensure_output_path(args.output_dir, f"{_slugify_url(su)}_{stamp}.ndjson") for su in shard_urls]
+            if args.process_pool:
+                tasks = []
+                for shard, shard_file in zip(shard_urls, shard_files):
+                    tasks.append((shard, 'ndjson', args.output_dir, args.no_headless, args.max_attempts, True, shard_file, None))
+                results = []
+                with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+                    future_map = {executor.submit(process_url_task, t): t[0] for t in tasks}
+                    for future in as_completed(future_map):
+                        su = future_map[future]
+                        try:
+                            res = future.result()
+                            results.append(res)
+                            print(f"[OK] shard {su} → {res['count']} produits")
+                        except Exception as e:
+                            print(f"[ERREUR] shard {su} → {e}")
+            else:
+                headless = not args.no_headless
+                if not headless and platform.system().lower() == 'linux' and not os.environ.get('DISPLAY'):
+                    print("[INFO] Aucun serveur X détecté (DISPLAY absent) → forçage du mode headless.")
+                    headless = True
+                results = asyncio.run(_run_all(list(zip(shard_urls, shard_files)), args.workers, headless))
             if args.output:
                 final_out = args.output
             else:
                 base = _slugify_url(url)
-                final_out = _ensure_output_path(args.output_dir, f"{base}_merged_{int(time.time())}.{args.format}")
-            df = pd.DataFrame(all_products)
-            if args.format == 'csv':
-                df.to_csv(final_out, index=False, sep=';', encoding='utf-8-sig')
-            elif args.format == 'excel':
-                df.to_excel(final_out, index=False)
-            elif args.format == 'json':
-                df.to_json(final_out, orient='records', indent=2)
-            elif args.format == 'txt':
-                df.to_csv(final_out, index=False, sep='\t', encoding='utf-8')
+                final_out = _ensure_output_path(args.output_dir, f"{base}_merged_{stamp}.{args.format}")
+            # Fichiers relus dans l'ordre des pages (pas d'arrivée); seuls les shards réussis en ont un
+            written = {r['output'] for r in results if r.get('count')}
+            done_files = [f for f in shard_files if f in written]
+            seen = SeenUrls.load(args.seen_file)
+            total = _merge_shards(done_files, args.format, final_out, seen)
+            if args.seen_file:
+                seen.save(args.seen_file)
+            for f in done_files:
+                os.remove(f)
+            print(f"\n✅ Fusion des shards: {total} produits uniques")
             print(f"💾 Fichier final: {final_out}")
             return
 
     # Multi-URL: exécution parallèle
     tasks = []
     for url in args.urls:
-        tasks.append((url, args.format, args.output_dir, args.no_headless, args.max_attempts, False, None, False))
+        tasks.append((url, args.format, args.output_dir, args.no_headless, args.max_attempts, False, None, args.seen_file))
     results = []
     with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
         future_map = {executor.submit(process_url_task, t): t[0] for t in tasks}
@@ -439,6 +966,12 @@ def main():
                 print(f"\n[OK] {url} → {res['count']} produits, fichier: {res['output']}")
             except Exception as e:
                 print(f"\n[ERREUR] {url} → {e}")
+    if args.seen_file:
+        seen = SeenUrls.load(args.seen_file)
+        for r in results:
+            for cu in r.get('seen', []):
+                seen.add(cu)
+        seen.save(args.seen_file)
     total = sum(r.get('count', 0) for r in results)
     print(f"\n✅ Terminé: {len(results)} URLs traitées, {total} produits au total.")
 